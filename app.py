@@ -4,18 +4,80 @@ import importlib.util
 import threading
 import time
 from pathlib import Path
-from flask import Flask, render_template_string, request, jsonify
-from interpreter import interpret_step, save_spec
+from flask import Flask, Response, g, render_template_string, request, jsonify
+from interpreter import interpret_step, repair_spec, save_spec
 from cogen import generate_module
 from validation import validate_module
+from sandbox import get_pool
 from feedback import process_report
+from specs import known_entities, record_version, run_pending_migrations, with_dependents
+from metrics import STAGE_SECONDS, ROUTE_SECONDS, span, observe, share_across_processes, render as render_metrics
+import state
 
 BASE_DIR = Path(__file__).parent
 MODULES_DIR = BASE_DIR / "modules"
 DATA_DIR = BASE_DIR / "data"
 
-progress_state = {"progress": 0, "message": ""}
-chat_history = []  # udržujeme historii konverzace
+MAX_FIX_ATTEMPTS = 3
+
+# sdílený stav všech worker procesů (data/state.db)
+PROGRESS = "progress_state"
+CHAT_HISTORY = "chat_history"  # udržujeme historii konverzace
+
+
+class RegistryReloader:
+    """
+    WSGI entry point that rebuilds the Flask app from `factory` whenever the shared
+    registry generation changes, i.e. after modules were (re)generated by any worker.
+    """
+
+    def __init__(self, factory, check_interval: float = 1.0):
+        self.factory = factory
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self.generation = state.get(state.REGISTRY_GENERATION, 0)
+        self.app = factory()
+        self._checked = time.monotonic()
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked < self.check_interval:
+            return
+        self._checked = now
+        generation = state.get(state.REGISTRY_GENERATION, 0)
+        if generation == self.generation:
+            return
+        with self._lock:
+            if generation != self.generation:
+                self.app = self.factory()
+                self.generation = generation
+                print(f"🔄 Reloaded modules (registry generation {generation})")
+
+    def __call__(self, environ, start_response):
+        self._maybe_reload()
+        return self.app(environ, start_response)
+
+
+def _names(spec):
+    return {str(e.get("name", "")).strip().lower() for e in spec.get("entities", [])}
+
+
+def _error_set(report):
+    return {(e.get("type"), e.get("entity"), e.get("file"), e.get("message")) for e in report.get("errors", [])}
+
+
+def _changed_entities(old, new):
+    """Lowercased names of entities that differ between two specs."""
+    before = {e.get("name", "").lower(): e for e in old.get("entities", [])}
+    return {e.get("name", "").lower() for e in new.get("entities", []) if before.get(e.get("name", "").lower()) != e}
+
+
+def _referencing(spec, names):
+    """Lowercased names of entities with a ref attribute pointing at one of `names`."""
+    return {
+        e.get("name", "").lower() for e in spec.get("entities", [])
+        if any(str(a.get("ref", "")).lower() in names for a in e.get("attributes", []))
+    }
 
 
 def register_blueprints(app):
@@ -45,7 +107,40 @@ def create_app():
     MODULES_DIR.mkdir(exist_ok=True)
     DATA_DIR.mkdir(exist_ok=True)
 
+    # generated pages share one cacheable stylesheet (static/generated.css)
+    app.config["SEND_FILE_MAX_AGE_DEFAULT"] = 3600
+    # compile the shared layout and macros once; generated pages only compile their own blocks
+    app.jinja_env.get_template("layout.html")
+    app.jinja_env.get_template("macros.html")
+
     register_blueprints(app)
+    # smoke-test runner boots now, so the first validation does not pay interpreter startup
+    get_pool().warm()
+    # records stored under an older spec are migrated in the background, batch by batch
+    threading.Thread(target=run_pending_migrations, daemon=True).start()
+
+    # --- Per-route latency of generated blueprints ---
+    share_across_processes()  # /metrics sums all worker processes, whichever one is scraped
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_latency(response):
+        started = g.get("request_started")
+        if started is not None and request.blueprint:
+            observe(
+                ROUTE_SECONDS,
+                time.perf_counter() - started,
+                blueprint=request.blueprint,
+                endpoint=request.endpoint or "",
+                method=request.method,
+            )
+        return response
+
+    @app.get("/metrics")
+    def metrics():
+        return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
 
     # --- Homepage (chat UI) ---
     @app.route("/", methods=["GET"])
@@ -160,45 +255,86 @@ def create_app():
         data = request.get_json(force=True)
         user_msg = data.get("msg", "")
 
-        chat_history.append({"role": "user", "content": user_msg})
-        spec, reply, done = interpret_step(chat_history)
+        chat_history = state.append(CHAT_HISTORY, {"role": "user", "content": user_msg})
+        with span(STAGE_SECONDS, stage="interpret_step"):
+            spec, reply, done = interpret_step(chat_history)
 
         if done:
             if spec and spec.get("entities"):
-                save_spec(spec, "latest")
+                try:
+                    spec = with_dependents(spec)  # normalized, plus modules joining changed entities
+                except ValueError as e:
+                    return jsonify({"status": "question", "message": f"❌ {e} Please rename it."})
+                with span(STAGE_SECONDS, stage="save_spec"):
+                    save_spec(spec, "latest")
+                    record_version(spec)
                 # 1) vygeneruj modul
-                generate_module(spec)
+                with span(STAGE_SECONDS, stage="generate_module"):
+                    generate_module(spec)
                 # 2) spusť validaci
-                report = validate_module(spec)
+                with span(STAGE_SECONDS, stage="validate_module"):
+                    report = validate_module(spec)
+
+                # 3) předat feedbacku, opravovat jen dotčené entity (omezený počet pokusů)
+                attempts, repair_failed = 0, False
+                while report.get("status") != "ok" and attempts < MAX_FIX_ATTEMPTS:
+                    with span(STAGE_SECONDS, stage="process_report"):
+                        fb = process_report(report, chat_history, spec)
+                    plan = fb.get("fix_plan")
+
+                    if fb.get("next_action") == "repair_spec":
+                        with span(STAGE_SECONDS, stage="repair_spec"):
+                            fixed = repair_spec(spec, report.get("errors", []))
+                        if fixed:
+                            # entities generated earlier are referenced as they are, never redefined by a guess
+                            recorded, inside = known_entities(), _names(spec)
+                            fixed = {**fixed, "entities": [
+                                e for e in fixed.get("entities", [])
+                                if str(e.get("name", "")).strip().lower() in inside
+                                or str(e.get("name", "")).strip().lower() not in recorded
+                            ]}
+                        try:
+                            fixed = with_dependents(fixed) if fixed else None
+                        except ValueError:
+                            fixed = None  # invalid names, as bad as no answer
+                        if not fixed:
+                            repair_failed = True
+                            break
+                        # changed entities and those joining them (their labels may have changed)
+                        changed = _changed_entities(spec, fixed)
+                        plan = {**plan, "entities": sorted(set(plan["entities"]) | changed | _referencing(fixed, changed))}
+                        spec = fixed
+                        with span(STAGE_SECONDS, stage="save_spec"):
+                            save_spec(spec, "latest")
+                            record_version(spec)
+                    elif fb.get("next_action") != "auto_fix":
+                        break
+
+                    before = _error_set(report)
+                    attempts += 1
+                    with span(STAGE_SECONDS, stage="generate_module"):
+                        generate_module(spec, plan=plan)
+                    with span(STAGE_SECONDS, stage="validate_module"):
+                        report = validate_module(spec, plan=plan)
+                    if fb.get("next_action") == "auto_fix" and _error_set(report) == before:
+                        break  # cogen is deterministic, regenerating the same spec again changes nothing
 
                 if report.get("status") == "ok":
-                    progress_state["progress"] = 100
-                    progress_state["message"] = "Restarting..."
-
-                    def restart():
-                        time.sleep(1.0)
-                        os.execv(sys.executable, [sys.executable] + sys.argv)
-
-                    threading.Thread(target=restart).start()
-                    return jsonify({"status": "final", "message": "✅ Module generated & validated. Restarting…"})
-
-                # 3) předat feedbacku
-                fb = process_report(report, chat_history, spec)
-
-                if fb.get("next_action") == "auto_fix":
-                    generate_module(spec)
-                    report2 = validate_module(spec)
-                    if report2.get("status") == "ok":
-                        def restart():
-                            time.sleep(1.0)
-                            os.execv(sys.executable, [sys.executable] + sys.argv)
-                        threading.Thread(target=restart).start()
-                        return jsonify({"status": "final", "message": "✅ Auto-fix successful. Restarting…"})
-                    else:
-                        msg = fb.get("message", "") + "\\n\\nAuto-fix did not resolve all issues. What should I do next?"
-                        return jsonify({"status": "question", "message": msg})
-
-                return jsonify({"status": "question", "message": fb.get("message", "Validation issues found.")})
+                    state.put(PROGRESS, {"progress": 100, "message": "Reloading..."})
+                    state.publish_modules()
+                    if attempts:
+                        return jsonify({"status": "final", "message": "✅ Auto-fix successful. Reloading…"})
+                    return jsonify({"status": "final", "message": "✅ Module generated & validated. Reloading…"})
+
+                # describe what is left after the last attempt, not the report before it
+                with span(STAGE_SECONDS, stage="process_report"):
+                    fb = process_report(report, chat_history, spec, final=True)
+                msg = fb.get("message", "Validation issues found.")
+                if repair_failed:
+                    msg = "❌ I could not repair the specification automatically.\n\n" + msg
+                elif attempts:
+                    msg = f"❌ Auto-fix did not resolve all issues after {attempts} attempt(s).\n\n" + msg
+                return jsonify({"status": "question", "message": msg})
 
             else:
                 return jsonify({"status": "error", "message": "❌ No valid spec found, cannot generate module."})
@@ -209,5 +345,7 @@ def create_app():
 
 
 if __name__ == "__main__":
-    app = create_app()
-    app.run(host="127.0.0.1", port=5000, debug=True)
\ No newline at end of file
+    # development server; for production use wsgi.py (e.g. gunicorn -w 4 wsgi:app)
+    from werkzeug.serving import run_simple
+
+    run_simple("127.0.0.1", 5000, RegistryReloader(create_app), use_debugger=True, use_reloader=True, threaded=True)
\ No newline at end of file
@@ -0,0 +1,82 @@
+"""
+Batch generation without the chat loop:
+
+    python cli.py specs/ extra.json --workers 8
+
+Loads and normalizes the spec files (or every *.json in a directory), generates all
+entities and validates them in parallel, prints a summary and exits non-zero on issues.
+On success running app workers are told to reload the modules (and apply pending record
+migrations).
+"""
+import argparse
+import os
+import sys
+import time
+from collections import defaultdict
+
+from cogen import generate_module
+from sandbox import get_pool
+from specs import load_specs, record_version, with_dependents
+from validation import validate_module
+import state
+
+
+def _print_report(spec, report, elapsed):
+    errors = report.get("errors", [])
+    by_scope = defaultdict(list)
+    for e in errors:
+        by_scope[e.get("entity") or e.get("file") or "spec"].append(e)
+
+    print(f"\n{len(spec['entities'])} entities processed in {elapsed:.2f}s")
+    if not errors:
+        print("✅ All modules generated & validated.")
+        return
+    print(f"❌ {len(errors)} issue(s) in {len(by_scope)} scope(s):")
+    for scope, errs in sorted(by_scope.items()):
+        print(f"  {scope}")
+        for e in errs:
+            print(f"    • [{e.get('type', 'issue')}] {e.get('message', '')}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Generate and validate CRUD modules from spec files.")
+    parser.add_argument("specs", nargs="+", help="spec JSON files or directories containing them")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1,
+                        help="parallel generation/validation workers (default: CPU count)")
+    parser.add_argument("--no-validate", action="store_true", help="only generate, skip validation")
+    args = parser.parse_args(argv)
+
+    try:
+        spec = load_specs(args.specs)
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 2
+    if not spec["entities"]:
+        print("❌ No entities found in the given specs.", file=sys.stderr)
+        return 2
+
+    given = {e["name"] for e in spec["entities"]}
+    spec = with_dependents(spec)
+    for e in spec["entities"]:
+        if e["name"] not in given:
+            print(f"↻ Regenerating {e['name']}: it references an entity whose attributes changed")
+
+    started = time.perf_counter()
+    if not args.no_validate:
+        get_pool().warm(args.workers)  # runners boot while the modules are generated
+    version = record_version(spec)
+    generate_module(spec, workers=args.workers)
+    report = {"status": "ok"} if args.no_validate else validate_module(spec, workers=args.workers)
+    _print_report(spec, report, time.perf_counter() - started)
+    print(f"Spec version: v{version:04d}")
+    if report.get("status") != "ok":
+        return 1
+
+    # running workers reload the modules and apply pending record migrations
+    generation = state.publish_modules()
+    print(f"Published registry generation {generation}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
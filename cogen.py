@@ -1,153 +1,210 @@
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Any, Dict, Optional
+
+from specs import known_entities
+from store import ID_FIELD
 
 BASE_DIR = Path(__file__).parent
 MODULES_DIR = BASE_DIR / "modules"
 
 
-def generate_module(spec: dict):
-    """Generate Flask blueprints (CRUD) for each entity in spec."""
-    if not spec or "entities" not in spec or not spec["entities"]:
-        print("❌ No entities in spec, cannot generate module.")
-        return
-
-    MODULES_DIR.mkdir(exist_ok=True)
-
-    for entity in spec["entities"]:
-        name = entity["name"].lower()
-        attrs = entity.get("attributes", [])
-        entity_dir = MODULES_DIR / name
-        templates_dir = entity_dir / "templates" / name
-
-        entity_dir.mkdir(parents=True, exist_ok=True)
-        templates_dir.mkdir(parents=True, exist_ok=True)
-
-        # ---------- Blueprint (__init__.py) ----------
-        # build POST dict and update lines
-        post_lines = ",\n".join(
-            [f'            "{a["name"]}": request.form.get("{a["name"]}")' for a in attrs]
-        )
-        update_lines = "\n".join(
-            [f'        data[idx]["{a["name"]}"] = request.form.get("{a["name"]}")' for a in attrs]
-        )
-
-        bp_code = f"""
-from flask import Blueprint, render_template, request, redirect, url_for
-
-bp = Blueprint("{name}", __name__, url_prefix="/{name}", template_folder="templates")
-
-data = []  # in-memory storage
-
-@bp.route("/")
-def list_{name}():
-    return render_template("{name}/list.html", items=data)
-
-@bp.route("/new", methods=["GET","POST"])
-def new_{name}():
-    if request.method == "POST":
-        item = {{
-{post_lines}
-        }}
-        data.append(item)
-        return redirect(url_for("{name}.list_{name}"))
-    return render_template("{name}/form.html")
-
-@bp.route("/edit/<int:idx>", methods=["GET","POST"])
-def edit_{name}(idx):
-    if idx < 0 or idx >= len(data):
-        return redirect(url_for("{name}.list_{name}"))
-    if request.method == "POST":
-{update_lines}
-        return redirect(url_for("{name}.list_{name}"))
-    return render_template("{name}/form.html", item=data[idx], idx=idx)
-
-@bp.route("/delete/<int:idx>")
-def delete_{name}(idx):
-    if 0 <= idx < len(data):
-        data.pop(idx)
-    return redirect(url_for("{name}.list_{name}"))
-"""
-        (entity_dir / "__init__.py").write_text(bp_code.strip(), encoding="utf-8")
-
-        # ---------- Templates (list.html, form.html) ----------
-        th_headers = "\n".join([f"          <th>{a['name']}</th>" for a in attrs])
-        td_cells = "\n".join([f"          <td>{{{{ item['{a['name']}'] }}}}</td>" for a in attrs])
-
-        list_html = f"""
-<!DOCTYPE html>
-<html>
-  <head>
-    <meta charset="utf-8">
-    <title>{entity["name"]} list</title>
-    <style>
-      table {{ border-collapse: collapse; width: 100%; }}
-      th, td {{ border: 1px solid #ccc; padding: 8px; text-align: left; }}
-      th {{ background: #f2f2f2; }}
-      a.button {{ padding: 4px 8px; background: #111; color: #fff; text-decoration: none; border-radius: 6px; }}
-      a.button:hover {{ background: #333; }}
-    </style>
-  </head>
-  <body>
+def _references(attrs, entities: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, str]]:
+    """
+    Foreign-key attributes ({"name": ..., "type": "ref", "ref": "<Entity>"}) resolved to
+    {attr name: {"module": ..., "label": ...}}. Their values are record ids of the target,
+    shown by its label attribute. `entities` are those of the spec plus the ones generated
+    earlier (specs.known_entities); references to unknown entities are skipped.
+    """
+    refs = {}
+    for a in attrs:
+        target = entities.get(str(a.get("ref", "")).lower())
+        if not target:
+            continue
+        names = [t["name"] for t in target.get("attributes", []) if t.get("name")]
+        label = a.get("display")
+        if label not in names:  # not given, or no longer an attribute of the target
+            # the first descriptive attribute; a user-defined "id" is rarely readable
+            label = next((n for n in names if n.lower() != "id"), names[0] if names else ID_FIELD)
+        refs[a["name"]] = {"module": target["name"].lower(), "label": label}
+    return refs
+
+
+def _generate_entity(entity: Dict[str, Any], entities: Dict[str, Dict[str, Any]]):
+    name = entity["name"].lower()
+    attrs = entity.get("attributes", [])
+    refs = _references(attrs, entities)
+    entity_dir = MODULES_DIR / name
+    templates_dir = entity_dir / "templates" / name
+
+    entity_dir.mkdir(parents=True, exist_ok=True)
+    templates_dir.mkdir(parents=True, exist_ok=True)
+
+    # ---------- Templates (list.html, form.html) ----------
+    # pages extend the shared templates/layout.html and use templates/macros.html,
+    # so each entity only carries its attribute-specific parts
+    def list_cell(a):
+        aname = a["name"]
+        if aname in refs:
+            r = refs[aname]
+            return f"""        {{{{ ref_cell(related["{r['module']}"], item["{aname}"], "{r['label']}") }}}}"""
+        return f"""        <td>{{{{ item["{aname}"] }}}}</td>"""
+
+    th_headers = "\n".join([f"        <th>{a['name']}</th>" for a in attrs])
+    td_cells = "\n".join([list_cell(a) for a in attrs])
+
+    list_html = f"""
+{{% extends "layout.html" %}}
+{{% from "macros.html" import ref_cell, row_actions %}}
+{{% block title %}}{entity["name"]} list{{% endblock %}}
+{{% block content %}}
     <h2>{entity["name"]} list</h2>
     <p><a href="{{{{ url_for('{name}.new_{name}') }}}}" class="button">+ New {entity["name"]}</a></p>
     <table>
       <thead>
         <tr>
 {th_headers}
-          <th>Actions</th>
+        <th>Actions</th>
         </tr>
       </thead>
       <tbody>
         {{% for item in items %}}
         <tr>
 {td_cells}
-          <td>
-            <a href="{{{{ url_for('{name}.edit_{name}', idx=loop.index0) }}}}" class="button">Edit</a>
-            <a href="{{{{ url_for('{name}.delete_{name}', idx=loop.index0) }}}}" class="button">Delete</a>
-          </td>
+        {{{{ row_actions("{name}", loop.index0) }}}}
         </tr>
         {{% endfor %}}
       </tbody>
     </table>
-  </body>
-</html>
+{{% endblock %}}
 """
-        (templates_dir / "list.html").write_text(list_html.strip(), encoding="utf-8")
-
-        form_fields = "\n".join(
-            [
-                (
-                    f'      <label>{a["name"].capitalize()}: '
-                    f'<input type="text" name="{a["name"]}" '
-                    f'value="{{{{ item["{a["name"]}"] if item else "" }}}}"></label>'
-                )
-                for a in attrs
-            ]
-        )
-
-        form_html = f"""
-<!DOCTYPE html>
-<html>
-  <head>
-    <meta charset="utf-8">
-    <title>{entity["name"]} form</title>
-    <style>
-      label {{ display: block; margin-top: 8px; }}
-      input {{ padding: 6px; width: 260px; }}
-      button {{ margin-top: 12px; padding: 8px 14px; background: #111; color: #fff; border: none; border-radius: 6px; cursor: pointer; }}
-      button:hover {{ background: #333; }}
-      a {{ text-decoration: none; }}
-    </style>
-  </head>
-  <body>
+    (templates_dir / "list.html").write_text(list_html.strip(), encoding="utf-8")
+
+    def form_field(a):
+        aname = a["name"]
+        if aname in refs:
+            r = refs[aname]
+            return (
+                f"""      {{{{ ref_field("{aname}", "{aname.capitalize()}", item, """
+                f"""related["{r['module']}"], "{r['label']}") }}}}"""
+            )
+        return f"""      {{{{ text_field("{aname}", "{aname.capitalize()}", item) }}}}"""
+
+    form_fields = "\n".join([form_field(a) for a in attrs])
+
+    form_html = f"""
+{{% extends "layout.html" %}}
+{{% from "macros.html" import text_field, ref_field %}}
+{{% block title %}}{entity["name"]} form{{% endblock %}}
+{{% block content %}}
     <h2>{entity["name"]} form</h2>
     <form method="post">
 {form_fields}
       <button type="submit">Save</button>
     </form>
     <p><a href="{{{{ url_for('{name}.list_{name}') }}}}">Back to list</a></p>
-  </body>
-</html>
+{{% endblock %}}
+"""
+    (templates_dir / "form.html").write_text(form_html.strip(), encoding="utf-8")
+
+    # ---------- Blueprint (__init__.py) ----------
+    # build POST dict for new/edit and the join indexes of referenced entities
+    post_lines = ",\n".join(
+        [f'        "{a["name"]}": request.form.get("{a["name"]}")' for a in attrs]
+    )
+    related_modules = sorted({r["module"] for r in refs.values()})
+    related_lines = ",\n".join(
+        [f'        "{m}": related_index("{m}")' for m in related_modules]
+    )
+
+    # pages are revalidated against the records and these templates, the same in every worker
+    revision = hashlib.sha1((list_html + form_html).encode("utf-8")).hexdigest()[:12]
+
+    bp_code = f"""
+from flask import Blueprint, render_template, request, redirect, url_for
+from store import Store, conditional_page, related_index
+
+bp = Blueprint("{name}", __name__, url_prefix="/{name}", template_folder="templates")
+
+store = Store("{name}")
+data = store.data  # in-memory storage
+
+RELATED = {related_modules!r}
+PAGE_CACHE = True  # reuse rendered pages until the next write
+REVISION = "{revision}"  # of the generated templates
+
+
+def _form_item():
+    return {{
+{post_lines}
+    }}
+
+
+def _related():
+    # prebuilt join indexes of referenced entities (key -> record)
+    return {{
+{related_lines}
+    }}
+
+
+def _page(key, render):
+    # ETag/Last-Modified from store versions, 304 on conditional GETs
+    return conditional_page(store, RELATED, key, render, cache=PAGE_CACHE, revision=REVISION)
+
+@bp.route("/")
+def list_{name}():
+    return _page("list", lambda: render_template("{name}/list.html", items=data, related=_related()))
+
+@bp.route("/new", methods=["GET","POST"])
+def new_{name}():
+    if request.method == "POST":
+        store.add(_form_item())
+        return redirect(url_for("{name}.list_{name}"))
+    return _page("new", lambda: render_template("{name}/form.html", related=_related()))
+
+@bp.route("/edit/<int:idx>", methods=["GET","POST"])
+def edit_{name}(idx):
+    store.sync()  # the record may have been added by another worker
+    if idx < 0 or idx >= len(data):
+        return redirect(url_for("{name}.list_{name}"))
+    if request.method == "POST":
+        store.update(idx, _form_item())
+        return redirect(url_for("{name}.list_{name}"))
+    return _page(f"edit{{idx}}", lambda: render_template("{name}/form.html", item=data[idx], idx=idx, related=_related()))
+
+@bp.route("/delete/<int:idx>")
+def delete_{name}(idx):
+    store.remove(idx)
+    return redirect(url_for("{name}.list_{name}"))
 """
-        (templates_dir / "form.html").write_text(form_html.strip(), encoding="utf-8")
+    (entity_dir / "__init__.py").write_text(bp_code.strip(), encoding="utf-8")
+
+    print(f"✅ Generated module for {entity['name']} in {entity_dir}")
+
+
+def generate_module(spec: dict, workers: Optional[int] = None, plan: Optional[Dict[str, Any]] = None):
+    """
+    Generate Flask blueprints (CRUD) for each entity in spec, in parallel.
+    With a fix plan (see feedback.build_fix_plan) only the entities it lists are rewritten.
+    """
+    if not spec or "entities" not in spec or not spec["entities"]:
+        print("❌ No entities in spec, cannot generate module.")
+        return
+
+    MODULES_DIR.mkdir(exist_ok=True)
+
+    entities = known_entities(spec)  # references may point at entities generated earlier
+    targets = spec["entities"]
+    if plan is not None:
+        wanted = {n.lower() for n in plan.get("entities", [])}
+        targets = [e for e in targets if e["name"].lower() in wanted]
+    if not targets:
+        return
+    workers = workers or min(len(targets), os.cpu_count() or 1)
 
-        print(f"✅ Generated module for {entity['name']} in {entity_dir}")
\ No newline at end of file
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [pool.submit(_generate_entity, e, entities) for e in targets]
+        for f in futures:
+            f.result()  # re-raise generation errors
@@ -1,5 +1,12 @@
+from pathlib import Path
 from typing import Dict, Any, List
 
+BASE_DIR = Path(__file__).parent
+MODULES_DIR = BASE_DIR / "modules"
+
+REGENERABLE = {"logic", "syntax", "security"}  # generated files are rewritten by cogen
+SPEC_ERRORS = {"spec"}  # need a change of the spec itself
+
 
 def _summarize_errors(errors: List[Dict[str, Any]], max_items: int = 8) -> str:
     lines = []
@@ -17,25 +24,58 @@ def _summarize_errors(errors: List[Dict[str, Any]], max_items: int = 8) -> str:
     return "\n".join(lines)
 
 
-def process_report(report: Dict[str, Any], conversation_history: list, spec: Dict[str, Any]) -> Dict[str, Any]:
+def _entity_of(error: Dict[str, Any]) -> str:
+    if error.get("entity"):
+        return str(error["entity"]).lower()
+    try:
+        return Path(error.get("file", "")).resolve().relative_to(MODULES_DIR.resolve()).parts[0]
+    except (ValueError, IndexError):
+        return ""
+
+
+def build_fix_plan(errors: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Entities (lowercased module names) and files affected by the reported errors."""
+    entities = {_entity_of(e) for e in errors} - {""}
+    files = {e["file"] for e in errors if e.get("file")}
+    return {"entities": sorted(entities), "files": sorted(files)}
+
+
+def process_report(report: Dict[str, Any], conversation_history: list, spec: Dict[str, Any],
+                   final: bool = False) -> Dict[str, Any]:
     """
     Returns:
       - {"next_action": "deliver", "message": "ok"}                         # everything fine
       - {"next_action": "ask_user", "message": "...human-readable..."}     # ask user what to do next
       - {"next_action": "auto_fix", "message": "attempting fix"}           # suggest auto regeneration
+      - {"next_action": "repair_spec", "message": "..."}                   # send errors back to the interpreter
+    Non-deliver results carry "fix_plan": {"entities": [...], "files": [...]} so only the
+    affected entities get regenerated and re-validated.
+    With `final` (no automatic attempts left) the result is always ask_user.
     """
     if not report or report.get("status") == "ok":
         return {"next_action": "deliver", "message": "ok"}
 
     errors = report.get("errors", [])
     summary = _summarize_errors(errors)
+    plan = build_fix_plan(errors)
+    in_spec = {str(e.get("name", "")).lower() for e in (spec or {}).get("entities", [])}
+    scoped = all(_entity_of(e) in in_spec for e in errors)
+    types = {e.get("type") for e in errors}
 
-    # Simple heuristic: if most errors are "logic" (missing attrs/templates), try auto-fix (regen)
-    logic_count = sum(1 for e in errors if e.get("type") == "logic")
-    if logic_count >= len(errors) and len(errors) > 0:
+    # generated code is wrong (missing attrs/templates/routes, broken syntax) -> regenerate affected entities
+    if not final and errors and scoped and types <= REGENERABLE:
         return {
             "next_action": "auto_fix",
-            "message": "I found logical issues that might be fixed by regenerating templates. Attempting auto-fix…\n\n" + summary
+            "message": "I found logical issues that might be fixed by regenerating templates. Attempting auto-fix…\n\n" + summary,
+            "fix_plan": plan,
+        }
+
+    # the spec itself is inconsistent (e.g. reference to an unknown entity) -> let the interpreter repair it
+    if not final and errors and scoped and types & SPEC_ERRORS and types <= SPEC_ERRORS | REGENERABLE:
+        return {
+            "next_action": "repair_spec",
+            "message": "The specification needs a correction. Asking the assistant to repair it…\n\n" + summary,
+            "fix_plan": plan,
         }
 
     # Otherwise ask the user (or route back to interpreter in outer flow)
@@ -46,4 +86,5 @@ def process_report(report: Dict[str, Any], conversation_history: list, spec: Dic
             f"{summary}\n\n"
             "Would you like me to refine the specification (ask follow-up questions) or try to regenerate the module?"
         ),
+        "fix_plan": plan,
     }
\ No newline at end of file
@@ -2,11 +2,13 @@ import os, json
 from pathlib import Path
 from dotenv import load_dotenv
 from openai import OpenAI
+from metrics import STAGE_SECONDS, span, record_usage
 
 load_dotenv()
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 DATA_DIR = Path(__file__).parent / "data"
+MODEL = "gpt-4.1-mini"
 last_valid_spec = {"entities": []}  # držíme draft
 
 
@@ -21,15 +23,23 @@ def interpret_step(history):
                 "Always maintain an internal JSON draft of entities and attributes, but DO NOT show the JSON to the user.\n"
                 "Instead, talk naturally: ask short clarification questions, propose summaries, and at the end ask the user to confirm.\n"
                 "If the user confirms that summarization in any form or language, then output ONLY the JSON spec inside a ```json ... ``` block.\n"
+                "The spec has the shape {\"entities\": [{\"name\": ..., \"attributes\": [{\"name\": ..., \"type\": ...}]}]}.\n"
+                "Entity and attribute names are identifiers: letters, digits and underscores, starting with a letter (e.g. date_of_birth).\n"
+                "When an entity points to another one (e.g. a student's computer), use an attribute "
+                "{\"name\": ..., \"type\": \"ref\", \"ref\": \"<other entity name>\"}.\n"
+                "When the user renames an existing attribute, add \"renamed_from\": \"<old name>\" to it, "
+                "otherwise the stored values of the old attribute are dropped.\n"
             ),
         }
     ] + history
 
-    response = client.chat.completions.create(
-        model="gpt-4.1-mini",
-        messages=messages,
-        max_tokens=800,
-    )
+    with span(STAGE_SECONDS, stage="llm_call"):
+        response = client.chat.completions.create(
+            model=MODEL,
+            messages=messages,
+            max_tokens=800,
+        )
+    record_usage(MODEL, getattr(response, "usage", None))
     text = response.choices[0].message.content.strip()
 
     spec = None
@@ -39,11 +49,9 @@ def interpret_step(history):
     try:
         if "```json" in text:
             # finální JSON, který uživatel nepotřebuje vidět
-            parts = text.split("```")
-            json_part = [p for p in parts if p.strip().startswith("json")]
-            if json_part:
-                jtxt = json_part[0].replace("json", "", 1).strip()
-                spec = json.loads(jtxt)
+            parsed = _json_block(text)
+            if parsed is not None:
+                spec = parsed
                 last_valid_spec = spec
                 done = True
                 msg = "✅ Specification confirmed. Generating module..."
@@ -62,6 +70,61 @@ def interpret_step(history):
     return spec, msg, done
 
 
+def _json_block(text):
+    """Parse the ```json ... ``` block of a model answer, None if there is none."""
+    parts = text.split("```")
+    json_part = [p for p in parts if p.strip().startswith("json")]
+    if not json_part:
+        return None
+    return json.loads(json_part[0].replace("json", "", 1).strip())
+
+
+def repair_spec(spec, errors):
+    """
+    Ask the model to correct the spec for the given validation errors only.
+    Sends just the spec and the errors (not the whole conversation); returns the
+    corrected spec, or None if the answer holds no usable JSON.
+    """
+    global last_valid_spec
+
+    error_lines = "\n".join(
+        f"- [{e.get('type', 'issue')}] {e.get('entity') or e.get('file') or 'spec'}: {e.get('message', '')}"
+        for e in errors
+    )
+    messages = [
+        {
+            "role": "system",
+            "content": (
+                "You repair JSON specifications of simple CRUD models.\n"
+                "Change only what is needed to resolve the listed validation errors and keep everything else as is.\n"
+                "Output ONLY the corrected JSON spec inside a ```json ... ``` block.\n"
+            ),
+        },
+        {
+            "role": "user",
+            "content": f"Spec:\n```json\n{json.dumps(spec, indent=2, ensure_ascii=False)}\n```\n\nValidation errors:\n{error_lines}",
+        },
+    ]
+
+    with span(STAGE_SECONDS, stage="llm_call"):
+        response = client.chat.completions.create(
+            model=MODEL,
+            messages=messages,
+            max_tokens=800,
+        )
+    record_usage(MODEL, getattr(response, "usage", None))
+
+    try:
+        fixed = _json_block(response.choices[0].message.content.strip())
+    except Exception as e:
+        print("⚠️ Error parsing repaired JSON:", e)
+        return None
+    if not fixed or not fixed.get("entities"):
+        return None
+    last_valid_spec = fixed
+    return fixed
+
+
 def save_spec(spec, name):
     """Uloží specifikaci do data/ adresáře"""
     DATA_DIR.mkdir(exist_ok=True)
@@ -0,0 +1,61 @@
+"""
+Minimal closed-loop load generator (stdlib only) for comparing serving setups:
+
+    python app.py                               # dev server on :5000
+    gunicorn -w 4 -b 127.0.0.1:8000 wsgi:app    # production profile
+    python loadtest.py http://127.0.0.1:5000/student/ -c 16 -d 10
+    python loadtest.py http://127.0.0.1:8000/student/ -c 16 -d 10
+"""
+import argparse
+import http.client
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+def _worker(url, deadline, latencies, failures):
+    parts = urlsplit(url)
+    path = parts.path or "/"
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=10)
+    while time.perf_counter() < deadline:
+        t0 = time.perf_counter()
+        try:
+            conn.request("GET", path)
+            resp = conn.getresponse()
+            resp.read()
+            if resp.status >= 400:
+                failures.append(resp.status)
+            else:
+                latencies.append(time.perf_counter() - t0)
+        except (OSError, http.client.HTTPException):
+            failures.append(0)
+            conn.close()
+            conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=10)
+    conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure GET throughput of a URL.")
+    parser.add_argument("url")
+    parser.add_argument("-c", "--concurrency", type=int, default=16)
+    parser.add_argument("-d", "--duration", type=float, default=10.0, help="seconds")
+    args = parser.parse_args(argv)
+
+    latencies, failures = [], []
+    deadline = time.perf_counter() + args.duration
+    threads = [threading.Thread(target=_worker, args=(args.url, deadline, latencies, failures))
+               for _ in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    latencies.sort()
+    n = len(latencies)
+    print(f"{args.url}: {n / args.duration:.0f} req/s, {len(failures)} failures")
+    if n:
+        print(f"latency p50 {latencies[n // 2] * 1000:.1f} ms, p99 {latencies[int(n * 0.99)] * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+import atexit
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Dict, Tuple
+
+import state
+
+# Upper bounds (seconds) of latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+STAGE_SECONDS = "gai_stage_seconds"
+CHECK_SECONDS = "gai_validation_check_seconds"
+ROUTE_SECONDS = "gai_route_seconds"
+LLM_TOKENS = "gai_llm_tokens_total"
+
+DESCRIPTIONS = {
+    STAGE_SECONDS: ("histogram", "Duration of chat_step pipeline stages."),
+    CHECK_SECONDS: ("histogram", "Duration of individual validation checks."),
+    ROUTE_SECONDS: ("histogram", "Latency of requests served by generated blueprints."),
+    LLM_TOKENS: ("counter", "Tokens reported by the OpenAI API."),
+}
+
+SHARE_INTERVAL = 5.0  # seconds between snapshots of a worker process in the shared state
+SHARED_PREFIX = "metrics/"
+
+_lock = threading.Lock()
+_histograms: Dict[Tuple[str, Tuple], Dict] = {}
+_counters: Dict[Tuple[str, Tuple], float] = {}
+
+_shared_key = None  # state key of this process' snapshot once shared
+_shared_pid = None
+_last_share = 0.0
+
+
+def _key(name: str, labels: Dict[str, str]) -> Tuple[str, Tuple]:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def observe(name: str, value: float, **labels):
+    """Record one observation into the histogram `name`."""
+    key = _key(name, labels)
+    with _lock:
+        h = _histograms.get(key)
+        if h is None:
+            h = _histograms[key] = {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                h["buckets"][i] += 1
+        h["sum"] += value
+        h["count"] += 1
+    _maybe_share()
+
+
+def inc(name: str, value: float = 1, **labels):
+    """Increase the counter `name` by `value`."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+    _maybe_share()
+
+
+@contextmanager
+def span(name: str, **labels):
+    """Time the enclosed block and record it into the histogram `name`."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - t0, **labels)
+
+
+def timed(name: str, **labels):
+    """Decorator variant of span()."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name, **labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_usage(model: str, usage):
+    """Count prompt/completion tokens from an OpenAI `usage` object."""
+    if usage is None:
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        n = getattr(usage, kind, None)
+        if n:
+            inc(LLM_TOKENS, n, model=model, kind=kind.split("_")[0])
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(pairs) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _num(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _snapshot():
+    with _lock:
+        histograms = {k: {"buckets": list(v["buckets"]), "sum": v["sum"], "count": v["count"]}
+                      for k, v in _histograms.items()}
+        counters = dict(_counters)
+    return histograms, counters
+
+
+# ---------- Aggregation across worker processes ----------
+
+def share_across_processes():
+    """
+    Aggregate with the other worker processes of the deployment (gunicorn -w N): each one
+    stores a snapshot in the shared state (data/state.db) at most every SHARE_INTERVAL
+    seconds, and render() sums all of them, so any worker can answer a scrape.
+    Snapshots of exited workers are kept, so the totals never go down.
+    """
+    global _shared_key, _shared_pid
+    if _shared_pid != os.getpid():  # once per process, also in forked workers
+        _shared_pid = os.getpid()
+        _shared_key = f"{SHARED_PREFIX}{_shared_pid}-{time.time_ns():x}"  # pids get reused
+        atexit.register(_share)
+
+
+def _share():
+    histograms, counters = _snapshot()
+    state.put(_shared_key, {
+        "histograms": [[name, pairs, h] for (name, pairs), h in histograms.items()],
+        "counters": [[name, pairs, v] for (name, pairs), v in counters.items()],
+    })
+
+
+def _maybe_share():
+    global _last_share
+    if _shared_pid != os.getpid():
+        return
+    now = time.monotonic()
+    if now - _last_share >= SHARE_INTERVAL:
+        _last_share = now
+        _share()
+
+
+def _merged():
+    _share()
+    histograms, counters = {}, {}
+    for snap in state.items(SHARED_PREFIX).values():
+        for name, pairs, h in snap["histograms"]:
+            acc = histograms.setdefault((name, tuple(map(tuple, pairs))),
+                                        {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0})
+            acc["buckets"] = [a + b for a, b in zip(acc["buckets"], h["buckets"])]
+            acc["sum"] += h["sum"]
+            acc["count"] += h["count"]
+        for name, pairs, value in snap["counters"]:
+            key = (name, tuple(map(tuple, pairs)))
+            counters[key] = counters.get(key, 0) + value
+    return histograms, counters
+
+
+def render() -> str:
+    """
+    Render all metrics in the Prometheus text exposition format (0.0.4): the sum over all
+    worker processes after share_across_processes(), otherwise those of this process.
+    """
+    histograms, counters = _merged() if _shared_pid == os.getpid() else _snapshot()
+
+    lines = []
+    described = set()
+
+    def header(name):
+        if name in described:
+            return
+        described.add(name)
+        mtype, text = DESCRIPTIONS.get(name, ("untyped", ""))
+        if text:
+            lines.append(f"# HELP {name} {text}")
+        lines.append(f"# TYPE {name} {mtype}")
+
+    for (name, pairs), h in sorted(histograms.items()):
+        header(name)
+        for bound, n in zip(BUCKETS, h["buckets"]):
+            lines.append(f"{name}_bucket{_labels(pairs + (('le', _num(bound)),))} {n}")
+        lines.append(f"{name}_bucket{_labels(pairs + (('le', '+Inf'),))} {h['count']}")
+        lines.append(f"{name}_sum{_labels(pairs)} {_num(h['sum'])}")
+        lines.append(f"{name}_count{_labels(pairs)} {h['count']}")
+
+    for (name, pairs), value in sorted(counters.items()):
+        header(name)
+        lines.append(f"{name}{_labels(pairs)} {_num(value)}")
+
+    return "\n".join(lines) + "\n"
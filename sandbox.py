@@ -0,0 +1,290 @@
+"""
+Out-of-process smoke tests for generated modules.
+
+Every generated blueprint is imported and exercised in a separate runner process
+limited by rlimits (CPU time, address space) and a wall-clock timeout, so broken or
+hungry generated code cannot stall or bloat the server, nor overwrite its sys.modules.
+Runner processes are kept warm in a pool and reused across validations.
+"""
+import atexit
+import importlib.util
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # not available on Windows, limits are then wall-clock only
+    resource = None
+
+BASE_DIR = Path(__file__).parent
+MODULES_DIR = BASE_DIR / "modules"
+
+CPU_SECONDS = 10  # per task
+MEMORY_BYTES = 1024 * 1024 * 1024  # address space of a runner process
+WALL_SECONDS = 30  # per task, enforced by the parent
+MAX_TASKS_PER_RUNNER = 50  # recycle runners so leaks of generated code do not accumulate
+POOL_SIZE = os.cpu_count() or 2
+
+
+class RunnerTimeout(Exception):
+    pass
+
+
+class RunnerCrashed(Exception):
+    pass
+
+
+# ---------- runner (child process) ----------
+
+def _set_cpu_budget(seconds: int):
+    if resource is None:
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = int(usage.ru_utime + usage.ru_stime) + seconds
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _fixture(attrs: List[Dict[str, Any]], round_no: int) -> Dict[str, str]:
+    """Unique, HTML-safe form values for every attribute."""
+    values = {}
+    for i, a in enumerate(attrs):
+        t = str(a.get("type", "")).lower()
+        if t in ("number", "int", "integer", "float", "decimal"):
+            values[a["name"]] = str(9000 + round_no * 100 + i)
+        else:
+            values[a["name"]] = f"fx{round_no}v{i}"
+    return values
+
+
+def _crud_cycle(task: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Import the entity blueprint and run:
+      GET /<e>/, GET /<e>/new, POST /<e>/new, GET /<e>/edit/0, POST /<e>/edit/0, GET /<e>/delete/0
+    checking that written values show up in (and disappear from) the list page.
+    """
+    from flask import Flask
+
+    name = task["entity"]
+    attrs = [a for a in task.get("attributes", []) if a.get("name")]
+    init_file = Path(task.get("modules_dir") or MODULES_DIR) / name / "__init__.py"
+    errs = []
+
+    def err(message):
+        errs.append({"type": "logic", "entity": name, "message": message})
+
+    module_name = f"modules.{name}"
+    sys.modules.pop(module_name, None)
+    try:
+        spec = importlib.util.spec_from_file_location(module_name, init_file)
+        mod = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = mod
+        spec.loader.exec_module(mod)
+        if not hasattr(mod, "bp"):
+            raise RuntimeError(f"Module {module_name} has no 'bp' blueprint.")
+        app = Flask("sandbox", root_path=str(BASE_DIR))
+        app.config["PROPAGATE_EXCEPTIONS"] = True  # report view errors instead of logging 500s
+        app.register_blueprint(mod.bp)
+    except Exception as e:
+        err(f"Failed to import blueprint: {e.__class__.__name__}: {e}")
+        return errs
+    finally:
+        sys.modules.pop(module_name, None)
+
+    client = app.test_client()
+    base = f"/{name}"
+
+    def check(method, path, ok_codes=(200,), **kwargs):
+        try:
+            r = client.open(path, method=method, **kwargs)
+        except Exception as e:
+            err(f"{method} {path} raised {e.__class__.__name__}: {e}")
+            return None
+        if r.status_code not in ok_codes:
+            err(f"{method} {path} returned {r.status_code}")
+            return None
+        return r.get_data(as_text=True)
+
+    def list_contains(values, expected, step):
+        page = check("GET", f"{base}/")
+        if page is None:
+            return
+        for aname, v in values.items():
+            if (v in page) != expected:
+                state = "missing from" if expected else "still present in"
+                err(f"Value of '{aname}' {state} list after {step}")
+
+    check("GET", f"{base}/")
+    check("GET", f"{base}/new")
+
+    created = _fixture(attrs, 1)
+    if check("POST", f"{base}/new", ok_codes=(200, 302, 303), data=created) is None:
+        return errs
+    list_contains(created, True, "POST /new")
+
+    form = check("GET", f"{base}/edit/0")
+    if form is not None:
+        refs = {a["name"] for a in attrs if a.get("ref")}  # selects have no options without the related module
+        for aname, v in created.items():
+            if aname not in refs and v not in form:
+                err(f"Value of '{aname}' not prefilled in edit form")
+
+    updated = _fixture(attrs, 2)
+    if check("POST", f"{base}/edit/0", ok_codes=(200, 302, 303), data=updated) is not None:
+        list_contains(updated, True, "POST /edit/0")
+
+    if check("GET", f"{base}/delete/0", ok_codes=(200, 302, 303)) is not None:
+        list_contains(updated, False, "GET /delete/0")
+
+    return errs
+
+
+def _serve():
+    """Runner main loop: one JSON task per stdin line, one JSON result per stdout line."""
+    if resource is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (MEMORY_BYTES, MEMORY_BYTES))
+    # output of generated code (prints, child processes) must not corrupt the protocol
+    protocol = os.fdopen(os.dup(1), "w", encoding="utf-8")
+    os.dup2(2, 1)
+    sys.stdout = sys.stderr
+
+    import flask  # noqa: F401  warm the imports before the first task
+    import store
+    store.PERSIST = False
+
+    for line in sys.stdin:
+        task = json.loads(line)
+        _set_cpu_budget(task.get("cpu_seconds", CPU_SECONDS))
+        try:
+            errors = _crud_cycle(task)
+        except Exception as e:
+            errors = [{"type": "logic", "entity": task.get("entity"), "message": f"Smoke test failed: {e}"}]
+        protocol.write(json.dumps({"errors": errors}) + "\n")
+        protocol.flush()
+
+
+# ---------- pool (parent process) ----------
+
+class _Runner:
+    def __init__(self):
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "sandbox"],
+            cwd=str(BASE_DIR),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+            env=dict(os.environ, PYTHONIOENCODING="utf-8"),
+        )
+        self.tasks = 0
+        self._replies = queue.Queue()
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self):
+        for line in self.proc.stdout:
+            self._replies.put(line)
+        self._replies.put(None)  # EOF
+
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def run(self, task: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        self.tasks += 1
+        try:
+            self.proc.stdin.write(json.dumps(task) + "\n")
+            self.proc.stdin.flush()
+            line = self._replies.get(timeout=timeout)
+        except queue.Empty:
+            raise RunnerTimeout(f"exceeded {timeout:g}s wall-clock limit")
+        except OSError as e:
+            raise RunnerCrashed(str(e))
+        if line is None:
+            raise RunnerCrashed(f"runner exited with code {self.proc.wait()}")
+        try:
+            return json.loads(line)
+        except ValueError:
+            raise RunnerCrashed(f"malformed runner reply {line[:80]!r}")
+
+    def kill(self):
+        if self.alive():
+            self.proc.kill()
+        self.proc.wait()
+
+
+class RunnerPool:
+    """Bounded pool of warm runner processes."""
+
+    def __init__(self, size: int = POOL_SIZE):
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def warm(self, n: int = 1):
+        """Start runners ahead of the first task until `n` are idle (they boot in the background)."""
+        for _ in range(min(n, self.size) - self._idle.qsize()):
+            self._idle.put(_Runner())
+
+    def run(self, task: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        timeout = timeout or WALL_SECONDS
+        with self._slots:
+            try:
+                runner = self._idle.get_nowait()
+            except queue.Empty:
+                runner = _Runner()
+            if not runner.alive():
+                runner = _Runner()
+            try:
+                result = runner.run(task, timeout)
+            except Exception:
+                runner.kill()
+                raise
+            if runner.alive() and runner.tasks < MAX_TASKS_PER_RUNNER:
+                self._idle.put(runner)
+            else:
+                runner.kill()
+            return result
+
+    def shutdown(self):
+        while True:
+            try:
+                self._idle.get_nowait().kill()
+            except queue.Empty:
+                return
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> RunnerPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = RunnerPool()
+            atexit.register(_pool.shutdown)
+        return _pool
+
+
+def smoke_test(entity_name: str, attributes: List[Dict[str, Any]], modules_dir: Path = MODULES_DIR) -> List[Dict[str, Any]]:
+    """Run the CRUD smoke test of one entity in a sandboxed runner."""
+    task = {"entity": entity_name, "attributes": attributes, "modules_dir": str(modules_dir)}
+    try:
+        return get_pool().run(task)["errors"]
+    except (RunnerTimeout, RunnerCrashed) as e:
+        return [{
+            "type": "runtime",
+            "entity": entity_name,
+            "message": f"Smoke test runner stopped: {e} (CPU {CPU_SECONDS}s / memory {MEMORY_BYTES // 2**20} MB limits)"
+        }]
+
+
+if __name__ == "__main__":
+    _serve()
@@ -0,0 +1,291 @@
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from store import RECORDS_DIR, fcntl, get_store
+
+BASE_DIR = Path(__file__).parent
+DATA_DIR = BASE_DIR / "data"
+
+
+def _check_name(name: str, what: str) -> str:
+    # names end up in file paths, generated Python and templates: identifiers only,
+    # a leading underscore is reserved for fields added by the store (e.g. "_id")
+    if not name.isidentifier() or name.startswith("_"):
+        raise ValueError(f"Invalid {what} name {name!r}: use letters, digits and '_' only, starting with a letter.")
+    return name
+
+
+def _normalize_attributes(attrs) -> List[Dict[str, Any]]:
+    # {"RAM": "int"} -> [{"name": "RAM", "type": "int"}], ["RAM"] -> [{"name": "RAM"}]
+    if isinstance(attrs, dict):
+        attrs = [{"name": k, "type": v} for k, v in attrs.items()]
+    out, seen = [], set()
+    for a in attrs or []:
+        if isinstance(a, str):
+            a = {"name": a}
+        if not isinstance(a, dict):
+            raise ValueError(f"Invalid attribute definition: {a!r}")
+        a = dict(a)
+        a["name"] = str(a.get("name", "")).strip()
+        if not a["name"] or a["name"] in seen:
+            continue
+        _check_name(a["name"], "attribute")
+        if a.get("display") is not None:
+            _check_name(str(a["display"]), "display attribute")
+        seen.add(a["name"])
+        a.setdefault("type", "ref" if a.get("ref") else "text")
+        out.append(a)
+    return out
+
+
+def normalize_spec(spec: Any) -> Dict[str, Any]:
+    """
+    Bring a spec to the canonical shape used by cogen and validation:
+      {"entities": [{"name": ..., "attributes": [{"name": ..., "type": ...}, ...]}, ...]}
+    Also accepts entities as a {name: {attr: type}} mapping (as in data/draft.json).
+    Raises ValueError for entity or attribute names that are not identifiers.
+    """
+    if not isinstance(spec, dict) or "entities" not in spec:
+        raise ValueError("Spec must be an object with an 'entities' key.")
+
+    entities = spec["entities"]
+    if isinstance(entities, dict):
+        entities = [{"name": k, "attributes": v} for k, v in entities.items()]
+    if not isinstance(entities, list):
+        raise ValueError("'entities' must be a list or an object.")
+
+    out = []
+    for ent in entities:
+        if not isinstance(ent, dict) or not str(ent.get("name", "")).strip():
+            raise ValueError(f"Entity without a name: {ent!r}")
+        name = _check_name(str(ent["name"]).strip(), "entity")
+        out.append({**ent, "name": name, "attributes": _normalize_attributes(ent.get("attributes"))})
+    return {**spec, "entities": out}
+
+
+def spec_files(paths: Iterable[str]) -> List[Path]:
+    """Expand directories to the *.json files they contain (sorted)."""
+    files = []
+    for p in map(Path, paths):
+        if p.is_dir():
+            files.extend(sorted(p.glob("*.json")))
+        else:
+            files.append(p)
+    return files
+
+
+def load_specs(paths: Iterable[str]) -> Dict[str, Any]:
+    """Load, normalize and merge spec files; a later entity of the same name replaces an earlier one."""
+    merged: Dict[str, Dict[str, Any]] = {}
+    for path in spec_files(paths):
+        try:
+            spec = normalize_spec(json.loads(path.read_text(encoding="utf-8")))
+        except (OSError, ValueError) as e:
+            raise ValueError(f"{path}: {e}") from e
+        for ent in spec["entities"]:
+            low = ent["name"].lower()
+            if low in merged:
+                print(f"⚠️ {path}: entity '{ent['name']}' overrides an earlier definition")
+            merged[low] = ent
+    return {"entities": list(merged.values())}
+
+
+# ---------- Versioned history ----------
+
+HISTORY_DIR = DATA_DIR / "specs"
+MIGRATIONS_DIR = DATA_DIR / "migrations"
+CURRENT = HISTORY_DIR / "current.json"  # latest known definition of every entity
+
+NUMERIC_TYPES = {"number", "int", "integer", "float", "decimal"}
+
+
+def _read_json(path: Path, default):
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return default
+
+
+def _write_json(path: Path, obj):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(obj, indent=2, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def latest_version() -> int:
+    versions = [int(p.stem[1:]) for p in HISTORY_DIR.glob("v*.json") if p.stem[1:].isdigit()]
+    return max(versions, default=0)
+
+
+def _rename_pairs(new_attrs, removed, added) -> Dict[str, str]:
+    """
+    Renames must be explicit ("renamed_from": "<old name>"). Anything else is a removed
+    plus an added attribute: guessing would move values into an unrelated attribute.
+    """
+    renamed = {}
+    for a in new_attrs:
+        src = a.get("renamed_from")
+        if a["name"] in added and src in removed:
+            renamed[src] = a["name"]
+    return renamed
+
+
+def diff_specs(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    Attribute changes of entities present in both specs, keyed by lowercased entity name:
+      {"added": [attr, ...], "removed": [name, ...], "renamed": {old: new}, "retyped": {name: type}}
+    Entities without changes are left out.
+    """
+    old_ents = {e["name"].lower(): e for e in normalize_spec(old)["entities"]}
+    changes = {}
+    for ent in normalize_spec(new)["entities"]:
+        low = ent["name"].lower()
+        if low not in old_ents:
+            continue
+        old_attrs, new_attrs = old_ents[low]["attributes"], ent["attributes"]
+        old_names = {a["name"]: a for a in old_attrs}
+        new_names = {a["name"]: a for a in new_attrs}
+        removed = [n for n in old_names if n not in new_names]
+        added = [n for n in new_names if n not in old_names]
+        renamed = _rename_pairs(new_attrs, removed, added)
+
+        change = {
+            "added": [new_names[n] for n in added if n not in renamed.values()],
+            "removed": [n for n in removed if n not in renamed],
+            "renamed": renamed,
+            "retyped": {n: new_names[n].get("type") for n in new_names
+                        if n in old_names and old_names[n].get("type") != new_names[n].get("type")},
+        }
+        for src, dst in renamed.items():
+            if old_names[src].get("type") != new_names[dst].get("type"):
+                change["retyped"][dst] = new_names[dst].get("type")
+        if any(change.values()):
+            changes[low] = change
+    return changes
+
+
+def known_entities(spec: Optional[Dict[str, Any]] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Entities references resolve against, keyed by lowercased name: every entity recorded in
+    data/specs/current.json (generated earlier), overridden by the entities of `spec`.
+    """
+    known = {e["name"].lower(): e for e in _read_json(CURRENT, {"entities": []})["entities"]}
+    for e in (spec or {}).get("entities", []):
+        known[str(e.get("name", "")).lower()] = e
+    return known
+
+
+def with_dependents(spec: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    `spec` plus the known entities it leaves out that reference an entity whose attributes
+    it changes. Their pages show labels of the referenced records, so their modules have to
+    be regenerated as well. Call before record_version(spec).
+    """
+    spec = normalize_spec(spec)
+    known = known_entities()
+    inside = {e["name"].lower() for e in spec["entities"]}
+    changed = {e["name"].lower() for e in spec["entities"]
+               if e["name"].lower() in known and known[e["name"].lower()]["attributes"] != e["attributes"]}
+    extra = [e for low, e in known.items() if low not in inside
+             and any(str(a.get("ref", "")).lower() in changed for a in e["attributes"])]
+    return {**spec, "entities": spec["entities"] + extra}
+
+
+def record_version(spec: Dict[str, Any]) -> int:
+    """
+    Store `spec` as the next version under data/specs/ and, if it changes attributes of
+    already known entities, queue a migration of their stored records.
+    Returns the version number (unchanged if the spec brings nothing new).
+    """
+    spec = normalize_spec(spec)
+    current = _read_json(CURRENT, {"entities": []})
+    changes = diff_specs(current, spec)
+    known = {e["name"].lower(): e for e in current["entities"]}
+    if not changes and all(known.get(e["name"].lower()) == e for e in spec["entities"]):
+        return latest_version()
+
+    version = latest_version() + 1
+    _write_json(HISTORY_DIR / f"v{version:04d}.json", spec)
+    for ent in spec["entities"]:
+        known[ent["name"].lower()] = ent
+    _write_json(CURRENT, {"entities": list(known.values())})
+    if changes:
+        _write_json(MIGRATIONS_DIR / f"v{version:04d}.json", changes)
+    return version
+
+
+# ---------- Record migrations ----------
+
+def _coerce(value, type_name):
+    if value is None or str(type_name).lower() not in NUMERIC_TYPES:
+        return value
+    text = str(value).strip().replace(",", ".")
+    try:
+        num = float(text)
+    except ValueError:
+        return value  # keep what the user typed rather than lose it
+    return str(int(num)) if num.is_integer() else str(num)
+
+
+def migrate_record(record: Dict[str, Any], change: Dict[str, Any]):
+    """Bring one record to the new shape in place; safe to apply twice."""
+    for src, dst in change.get("renamed", {}).items():
+        if src in record:
+            record[dst] = record.pop(src)
+    for name in change.get("removed", []):
+        record.pop(name, None)
+    for a in change.get("added", []):
+        record.setdefault(a["name"], None)
+    for name, type_name in change.get("retyped", {}).items():
+        if name in record:
+            record[name] = _coerce(record[name], type_name)
+
+
+def _migrate_entity(name: str, change: Dict[str, Any]) -> int:
+    store = get_store(name)
+    if store is not None:  # live store: migrate in batches while it keeps serving
+        return store.migrate(lambda r: migrate_record(r, change))
+
+    path = RECORDS_DIR / f"{name}.json"
+    records = _read_json(path, None)
+    if records is None:
+        return 0
+    for r in records:
+        migrate_record(r, change)
+    _write_json(path, records)
+    return len(records)
+
+
+def run_pending_migrations():
+    """
+    Apply queued migrations in version order. A plan is held under an exclusive lock while
+    it runs and renamed to .done afterwards. The lock dies with its process, so a plan
+    interrupted by a restart is applied again at the next start (the steps are idempotent).
+    """
+    for stale in MIGRATIONS_DIR.glob("v*.running"):  # claimed by rename before plans were locked
+        os.rename(stale, stale.with_suffix(".json"))
+
+    for plan in sorted(MIGRATIONS_DIR.glob("v*.json")):
+        try:
+            f = open(plan, encoding="utf-8")
+        except FileNotFoundError:
+            continue  # finished by another process meanwhile
+        with f:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    return  # another process is applying it, and the later plans after it
+            if not plan.exists():
+                continue  # finished by another process before the lock was free
+            try:
+                changes = json.loads(f.read())
+            except ValueError:
+                changes = {}
+            for name, change in changes.items():
+                n = _migrate_entity(name, change)
+                print(f"🔁 Migrated {n} {name} record(s) to spec {plan.stem}")
+            os.rename(plan, plan.with_suffix(".done"))
@@ -0,0 +1,72 @@
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict
+
+DB_PATH = Path(__file__).parent / "data" / "state.db"
+REGISTRY_GENERATION = "registry_generation"  # bumped whenever generated modules change
+
+_local = threading.local()  # one connection per thread and process
+
+
+def _conn() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.pid != os.getpid():  # do not reuse a connection inherited via fork
+        DB_PATH.parent.mkdir(exist_ok=True)
+        conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        _local.conn, _local.pid = conn, os.getpid()
+    return conn
+
+
+def _store(conn: sqlite3.Connection, key: str, value: Any):
+    conn.execute(
+        "INSERT INTO kv (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+        (key, json.dumps(value, ensure_ascii=False)),
+    )
+
+
+def get(key: str, default: Any = None) -> Any:
+    row = _conn().execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+    return json.loads(row[0]) if row else default
+
+
+def items(prefix: str) -> Dict[str, Any]:
+    """All keys starting with `prefix` and their values."""
+    rows = _conn().execute("SELECT key, value FROM kv WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+    return {k: json.loads(v) for k, v in rows}
+
+
+def put(key: str, value: Any):
+    _store(_conn(), key, value)
+
+
+def update(key: str, fn: Callable[[Any], Any], default: Any = None) -> Any:
+    """Atomically replace the value of `key` by fn(old value) across processes."""
+    conn = _conn()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+        value = fn(json.loads(row[0]) if row else default)
+        _store(conn, key, value)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return value
+
+
+def incr(key: str) -> int:
+    return update(key, lambda v: v + 1, 0)
+
+
+def append(key: str, item: Any) -> list:
+    return update(key, lambda v: v + [item], [])
+
+
+def publish_modules() -> int:
+    """Tell every running worker process to reload the generated modules."""
+    return incr(REGISTRY_GENERATION)
@@ -0,0 +1,249 @@
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from flask import make_response, request
+
+try:
+    import fcntl
+except ImportError:  # Windows: fine for the single-process development server
+    fcntl = None
+
+RECORDS_DIR = Path(__file__).parent / "data" / "records"
+PERSIST = True  # the sandbox turns this off so smoke tests never read or write real records
+PAGE_CACHE_SIZE = 256  # rendered pages kept per store
+MIGRATION_BATCH = 5000  # records migrated (and saved) per lock acquisition
+ID_FIELD = "_id"  # stable record id, the target of foreign-key attributes
+
+_stores: Dict[str, "Store"] = {}  # entity name -> live store, used for cross-entity joins
+
+
+def new_id() -> str:
+    return uuid.uuid4().hex
+
+
+def _now() -> datetime:
+    # HTTP dates have a one second resolution
+    return datetime.now(timezone.utc).replace(microsecond=0)
+
+
+def _file_time(seen) -> datetime:
+    return datetime.fromtimestamp(seen[1] / 1e9, timezone.utc).replace(microsecond=0)
+
+
+class Store:
+    """
+    Record storage of one generated entity.
+    Every record gets a stable, unique id (ID_FIELD) when it is added. `index` (record id ->
+    record) is kept up to date on every write, so related modules can join against it
+    without scanning `data`, and `version` is bumped so pages rendered from it can be
+    revalidated and cached.
+    Records are persisted to data/records/<name>.json; worker processes serialize writes
+    with a file lock and pick up each other's changes by watching that file.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.data: List[Dict[str, Any]] = []
+        self.index: Dict[Any, Dict[str, Any]] = {}
+        self.lock = threading.RLock()
+        self.epoch = format(time.time_ns(), "x")  # ETags of stores that are not persisted
+        self.version = 0
+        self.modified = _now()
+        self.page_cache: Dict[Tuple, str] = {}
+        self.path = RECORDS_DIR / f"{name}.json"
+        self._seen = None  # identity of the records file last loaded or saved
+        self._loads = 0  # bumped whenever `data` is replaced from the file
+        if PERSIST:
+            self.load()
+            if any(ID_FIELD not in item for item in self.data):
+                with self._writing():  # records saved before ids existed
+                    self._assign_ids()
+        _stores[name] = self  # a re-imported module replaces its previous store
+
+    def _stat(self):
+        try:
+            st = self.path.stat()
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size  # save() replaces the file, so the inode changes
+
+    @property
+    def tag(self) -> str:
+        """
+        Identity of the records currently served. Taken from the shared records file, so all
+        worker processes send the same ETag for the same data.
+        """
+        if not PERSIST:
+            return f"{self.epoch}.{self.version}"
+        return "{:x}.{:x}.{:x}".format(*self._seen) if self._seen else "empty"
+
+    def load(self):
+        with self.lock:
+            self._seen = self._stat()
+            if self._seen is not None:
+                self.data[:] = json.loads(self.path.read_text(encoding="utf-8"))  # same list object as module `data`
+                self._loads += 1
+                self.modified = _file_time(self._seen)
+            self._reindex()
+
+    def sync(self):
+        """Reload the records if another process has written them since."""
+        if not PERSIST:
+            return
+        with self.lock:
+            if self._stat() != self._seen:
+                self.load()
+                self.version += 1
+                self.page_cache.clear()
+
+    @contextmanager
+    def _file_lock(self):
+        if not PERSIST or fcntl is None:
+            yield
+            return
+        RECORDS_DIR.mkdir(parents=True, exist_ok=True)
+        with open(self.path.with_suffix(".lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _writing(self):
+        # thread lock + process lock, start from the latest records, save afterwards
+        with self.lock, self._file_lock():
+            self.sync()
+            yield
+            self._touch()
+
+    def save(self):
+        if not PERSIST:
+            return
+        with self.lock:
+            RECORDS_DIR.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(self.data, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, self.path)
+            self._seen = self._stat()
+            self.modified = _file_time(self._seen)
+
+    def _touch(self):
+        self.version += 1
+        self.modified = _now()
+        self.page_cache.clear()
+        self.save()
+
+    def _reindex(self):
+        self.index = {item.get(ID_FIELD): item for item in self.data}
+
+    def _assign_ids(self):
+        for item in self.data:
+            if ID_FIELD not in item:
+                item[ID_FIELD] = new_id()
+        self._reindex()
+
+    def add(self, item: Dict[str, Any]):
+        with self._writing():
+            item[ID_FIELD] = new_id()
+            self.data.append(item)
+            self.index[item[ID_FIELD]] = item
+
+    def update(self, idx: int, values: Dict[str, Any]) -> bool:
+        with self._writing():
+            if not 0 <= idx < len(self.data):
+                return False
+            self.data[idx].update(values)
+            self._reindex()
+            return True
+
+    def remove(self, idx: int) -> bool:
+        with self._writing():
+            if not 0 <= idx < len(self.data):
+                return False
+            self.data.pop(idx)
+            self._reindex()
+            return True
+
+    def migrate(self, fn: Callable[[Dict[str, Any]], None], batch_size: int = MIGRATION_BATCH) -> int:
+        """
+        Apply the idempotent `fn` to every record in place, one batch per acquisition of the
+        thread lock, so requests keep being served in between. The records file is written
+        once at the end. If another process wrote it meanwhile, the reloaded records are
+        migrated again; records added meanwhile by this process already have the new shape.
+        """
+        with self.lock:
+            self.sync()
+            loads = self._loads
+        start = 0
+        while True:
+            with self.lock:
+                if self._loads != loads:  # replaced by another worker's records, start over
+                    start, loads = 0, self._loads
+                batch = self.data[start:start + batch_size]
+                for item in batch:
+                    fn(item)
+            if len(batch) < batch_size:
+                break
+            start += batch_size
+            time.sleep(0)  # let request threads in
+
+        with self._writing():
+            if self._loads != loads:
+                for item in self.data:
+                    fn(item)
+            self._reindex()
+        return len(self.data)
+
+
+def get_store(name: str) -> Optional[Store]:
+    return _stores.get(name)
+
+
+def related_index(name: str) -> Dict[Any, Dict[str, Any]]:
+    """Join index (record id -> record) of entity `name`, or an empty one if that module is not loaded."""
+    store = _stores.get(name)
+    return store.index if store else {}
+
+
+def conditional_page(store: Store, related: Iterable[str], key: str, render: Callable[[], str],
+                     cache: bool = True, revision: str = ""):
+    """
+    Response for a page rendered from `store` (and the stores of `related` entities).
+    ETag and Last-Modified are derived from the records files (the ETag also from the
+    `revision` of the generated templates), requests with a matching If-None-Match get
+    304 Not Modified, and with `cache` the rendered HTML is reused until a write.
+    """
+    stores = [store] + [_stores.get(name) for name in related]
+    for s in stores:
+        if s:
+            s.sync()  # pick up writes of other worker processes
+    versions = tuple(s.tag if s else "0" for s in stores)
+    etag = "-".join((store.name, revision, key) + versions)
+    modified = max(s.modified for s in stores if s)
+
+    # only an ETag match is trusted: Last-Modified has a one second resolution (a write in the
+    # same second would look unmodified) and does not change when the templates are regenerated
+    if request.if_none_match.contains_weak(etag):
+        resp = make_response("", 304)
+    else:
+        html = store.page_cache.get((versions, key)) if cache else None
+        if html is None:
+            html = render()
+            if cache:
+                if len(store.page_cache) >= PAGE_CACHE_SIZE:
+                    store.page_cache.clear()
+                store.page_cache[(versions, key)] = html
+        resp = make_response(html)
+
+    resp.set_etag(etag)
+    resp.last_modified = modified
+    resp.cache_control.no_cache = True  # always revalidate, polling clients get cheap 304s
+    return resp
@@ -1,194 +1,298 @@
 import ast
-import importlib.util
-import sys
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
 from pathlib import Path
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
+
+from jinja2 import Environment, TemplateSyntaxError, nodes
+
+from metrics import CHECK_SECONDS, span, timed
+from sandbox import smoke_test
+from specs import known_entities
 
 BASE_DIR = Path(__file__).parent
 MODULES_DIR = BASE_DIR / "modules"
 
+DANGEROUS_CALLS = {
+    "eval", "exec", "compile", "__import__",
+    "os.system", "os.popen", "os.execv", "os.execl", "os.spawnl", "os.spawnv",
+    "subprocess.Popen", "subprocess.call", "subprocess.run", "subprocess.check_call", "subprocess.check_output",
+}
+DANGEROUS_IMPORTS = {"subprocess", "ctypes", "pickle", "marshal"}
+SENSITIVE_PATHS = ("/etc/passwd", "/etc/shadow")
+ROUTE_DECORATORS = {"route", "get", "post", "put", "patch", "delete"}
+FIELD_MACROS = {"text_field", "ref_field"}  # templates/macros.html, first argument is the input name
 
-def _read_text(path: Path) -> str:
-    try:
-        return path.read_text(encoding="utf-8")
-    except Exception as e:
-        return f"__READ_ERROR__: {e}"
+_jinja = Environment()
+
+
+# ---------- Python modules: one AST pass per file ----------
+
+class _ModuleVisitor(ast.NodeVisitor):
+    """Collects calls (with import aliases resolved), imports and route-decorated functions."""
+
+    def __init__(self):
+        self.aliases: Dict[str, str] = {}
+        self.imports: List[tuple] = []  # (module, lineno)
+        self.calls: List[tuple] = []  # (dotted name, lineno, ast.Call)
+        self.routes: Dict[str, List[str]] = {}  # function name -> url rules
+
+    def _dotted(self, node) -> str:
+        if isinstance(node, ast.Name):
+            return self.aliases.get(node.id, node.id)
+        if isinstance(node, ast.Attribute):
+            base = self._dotted(node.value)
+            return f"{base}.{node.attr}" if base else ""
+        return ""
+
+    def visit_Import(self, node):
+        for a in node.names:
+            self.imports.append((a.name, node.lineno))
+            self.aliases[a.asname or a.name.split(".")[0]] = a.name if a.asname else a.name.split(".")[0]
+
+    def visit_ImportFrom(self, node):
+        mod = node.module or ""
+        self.imports.append((mod, node.lineno))
+        for a in node.names:
+            self.aliases[a.asname or a.name] = f"{mod}.{a.name}" if mod else a.name
 
+    def visit_Call(self, node):
+        self.calls.append((self._dotted(node.func), node.lineno, node))
+        self.generic_visit(node)
 
-def _syntax_errors(py_file: Path) -> List[Dict[str, Any]]:
-    errors = []
+    def visit_FunctionDef(self, node):
+        for dec in node.decorator_list:
+            if (isinstance(dec, ast.Call) and isinstance(dec.func, ast.Attribute)
+                    and dec.func.attr in ROUTE_DECORATORS):
+                rule = dec.args[0].value if dec.args and isinstance(dec.args[0], ast.Constant) else ""
+                self.routes.setdefault(node.name, []).append(rule)
+        self.generic_visit(node)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+
+@timed(CHECK_SECONDS, check="parse_module")
+def _analyze_module(py_file: Path) -> Dict[str, Any]:
+    info = {"file": str(py_file), "error": None, "imports": [], "calls": [], "routes": {}}
     try:
-        src = py_file.read_text(encoding="utf-8")
-        ast.parse(src, filename=str(py_file))
+        tree = ast.parse(py_file.read_text(encoding="utf-8"), filename=str(py_file))
     except SyntaxError as e:
-        errors.append({
-            "type": "syntax",
-            "file": str(py_file),
-            "message": f"{e.__class__.__name__}: {e.msg} at line {e.lineno}, col {e.offset}"
-        })
+        info["error"] = f"{e.__class__.__name__}: {e.msg} at line {e.lineno}, col {e.offset}"
+        return info
     except Exception as e:
-        errors.append({
-            "type": "syntax",
-            "file": str(py_file),
-            "message": f"ParseError: {e}"
-        })
-    return errors
+        info["error"] = f"ParseError: {e}"
+        return info
+
+    v = _ModuleVisitor()
+    v.visit(tree)
+    info.update(imports=v.imports, calls=v.calls, routes=v.routes)
+    return info
+
+
+def _syntax_errors(info: Dict[str, Any]) -> List[Dict[str, Any]]:
+    if not info["error"]:
+        return []
+    return [{"type": "syntax", "file": info["file"], "message": info["error"]}]
 
 
-def _security_scan(text: str, file: Path) -> List[Dict[str, Any]]:
+@timed(CHECK_SECONDS, check="security")
+def _security_scan(info: Dict[str, Any]) -> List[Dict[str, Any]]:
     findings = []
-    dangerous = ["eval(", "exec(", "os.system(", "subprocess.Popen(", "subprocess.call(", "open('/etc/passwd'"]
-    for token in dangerous:
-        if token in text:
-            findings.append({
-                "type": "security",
-                "file": str(file),
-                "message": f"Found potentially dangerous token '{token}'"
-            })
+
+    def found(message):
+        findings.append({"type": "security", "file": info["file"], "message": message})
+
+    for mod, line in info["imports"]:
+        if mod.split(".")[0] in DANGEROUS_IMPORTS:
+            found(f"Import of '{mod}' at line {line}")
+    for name, line, call in info["calls"]:
+        if name in DANGEROUS_CALLS:
+            found(f"Call of '{name}()' at line {line}")
+        elif name in ("open", "io.open") and call.args and isinstance(call.args[0], ast.Constant):
+            path = str(call.args[0].value)
+            if path.startswith(SENSITIVE_PATHS):
+                found(f"open('{path}') at line {line}")
     return findings
 
 
-def _import_blueprint(module_name: str, init_file: Path):
-    spec = importlib.util.spec_from_file_location(module_name, init_file)
-    mod = importlib.util.module_from_spec(spec)
-    sys.modules[module_name] = mod
-    spec.loader.exec_module(mod)  # type: ignore
-    if not hasattr(mod, "bp"):
-        raise RuntimeError(f"Module {module_name} has no 'bp' blueprint.")
-    return mod.bp
+# ---------- Templates: one Jinja AST parse per file ----------
+
+class _FormFields(HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self.inputs = set()
+        self.scripts = 0
 
+    def handle_starttag(self, tag, attrs):
+        if tag == "script":
+            self.scripts += 1
+        elif tag in ("input", "select", "textarea"):
+            name = dict(attrs).get("name")
+            if name:
+                self.inputs.add(name)
 
-def _smoke_test_entity(entity_name: str) -> List[Dict[str, Any]]:
+
+@timed(CHECK_SECONDS, check="parse_template")
+def _analyze_template(tpl: Path) -> Dict[str, Any]:
     """
-    Build a tiny Flask app, register the entity blueprint, verify routes:
-      GET /<e>/, GET /<e>/new, POST /<e>/new, GET /<e>/edit/0, GET /<e>/delete/0
+    Fields referenced as item['x'] / item.x, names of submitted form inputs (HTML tags or
+    field macro calls), inline <script> tags and uses of the |safe filter.
     """
-    from flask import Flask
-    errs = []
-    mod_name = f"modules.{entity_name}"
-    init_file = MODULES_DIR / entity_name / "__init__.py"
-
+    info = {"file": str(tpl), "error": None, "fields": set(), "inputs": set(), "scripts": 0, "safe": 0}
     try:
-        bp = _import_blueprint(mod_name, init_file)
+        tree = _jinja.parse(tpl.read_text(encoding="utf-8"))
+    except TemplateSyntaxError as e:
+        info["error"] = f"TemplateSyntaxError: {e.message} at line {e.lineno}"
+        return info
     except Exception as e:
-        errs.append({
-            "type": "logic",
-            "entity": entity_name,
-            "message": f"Failed to import blueprint: {e}"
-        })
+        info["error"] = f"ParseError: {e}"
+        return info
+
+    for node in tree.find_all((nodes.Getitem, nodes.Getattr)):
+        if isinstance(node.node, nodes.Name) and node.node.name == "item":
+            if isinstance(node, nodes.Getattr):
+                info["fields"].add(node.attr)
+            elif isinstance(node.arg, nodes.Const):
+                info["fields"].add(node.arg.value)
+    info["safe"] = sum(1 for f in tree.find_all(nodes.Filter) if f.name == "safe")
+
+    html = _FormFields()
+    html.feed("".join(d.data for d in tree.find_all(nodes.TemplateData)))
+    info["inputs"], info["scripts"] = html.inputs, html.scripts
+    for call in tree.find_all(nodes.Call):
+        if (isinstance(call.node, nodes.Name) and call.node.name in FIELD_MACROS
+                and call.args and isinstance(call.args[0], nodes.Const)):
+            info["inputs"].add(call.args[0].value)
+    return info
+
+
+def _template_findings(info: Dict[str, Any]) -> List[Dict[str, Any]]:
+    errs = []
+    if info["error"]:
+        errs.append({"type": "syntax", "file": info["file"], "message": info["error"]})
+    if info["scripts"]:
+        errs.append({"type": "security", "file": info["file"], "message": "Inline <script> tag detected in template"})
+    if info["safe"]:
+        errs.append({"type": "security", "file": info["file"], "message": "'|safe' filter disables autoescaping"})
+    return errs
+
+
+# ---------- Checks ----------
+
+@timed(CHECK_SECONDS, check="smoke_test")
+def _smoke_test_entity(entity_name: str, attrs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Exercise the full CRUD cycle of the entity blueprint in a sandboxed runner process:
+      GET /<e>/, GET /<e>/new, POST /<e>/new, GET+POST /<e>/edit/0, GET /<e>/delete/0
+    """
+    return smoke_test(entity_name, attrs, MODULES_DIR)
+
+
+def _parsed(cache: Dict[Path, Dict[str, Any]], path: Path, analyze) -> Optional[Dict[str, Any]]:
+    if not path.exists():
+        return None
+    if path not in cache:
+        cache[path] = analyze(path)
+    return cache[path]
+
+
+def _entity_checks(ent: Dict[str, Any], known: set, parsed: Dict[Path, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    errs = []
+    name = ent.get("name", "")
+    if not name:
+        errs.append({"type": "logic", "message": "Entity without a name."})
         return errs
+    low = name.lower()
+    ent_dir = MODULES_DIR / low
+    init_py = ent_dir / "__init__.py"
+    list_tpl = ent_dir / "templates" / low / "list.html"
+    form_tpl = ent_dir / "templates" / low / "form.html"
+
+    if not init_py.exists():
+        errs.append({"type": "logic", "entity": name, "file": str(init_py), "message": f"Missing {init_py}"})
+    if not list_tpl.exists():
+        errs.append({"type": "logic", "entity": name, "file": str(list_tpl), "message": f"Missing {list_tpl}"})
+    if not form_tpl.exists():
+        errs.append({"type": "logic", "entity": name, "file": str(form_tpl), "message": f"Missing {form_tpl}"})
+
+    # route-decorated view functions
+    module = _parsed(parsed, init_py, _analyze_module)
+    if module and not module["error"]:
+        for fn in (f"list_{low}", f"new_{low}", f"edit_{low}", f"delete_{low}"):
+            if fn not in module["routes"]:
+                errs.append({"type": "logic", "entity": name, "message": f"Route '{fn}()' not found in {init_py}"})
 
-    app = Flask(__name__)
-    app.register_blueprint(bp)
-
-    client = app.test_client()
-    # list
-    r = client.get(f"/{entity_name}/")
-    if r.status_code != 200:
-        errs.append({
-            "type": "logic",
-            "entity": entity_name,
-            "message": f"GET /{entity_name}/ returned {r.status_code}"
-        })
-
-    # new (GET)
-    r = client.get(f"/{entity_name}/new")
-    if r.status_code != 200:
-        errs.append({
-            "type": "logic",
-            "entity": entity_name,
-            "message": f"GET /{entity_name}/new returned {r.status_code}"
-        })
+    # attributes rendered in the list and submitted by the form
+    attrs = ent.get("attributes", [])
+    if attrs:
+        list_info = _parsed(parsed, list_tpl, _analyze_template)
+        form_info = _parsed(parsed, form_tpl, _analyze_template)
+        for a in attrs:
+            aname = a.get("name", "")
+            if a.get("ref") and str(a["ref"]).lower() not in known:
+                errs.append({"type": "spec", "entity": name, "message": f"Attribute '{aname}' references unknown entity '{a['ref']}'"})
+            if aname:
+                if form_info and aname not in form_info["inputs"]:
+                    errs.append({"type": "logic", "entity": name, "message": f"Attribute '{aname}' not present in form.html"})
+                if list_info and aname not in list_info["fields"]:
+                    errs.append({"type": "logic", "entity": name, "message": f"Attribute '{aname}' not present in list.html"})
 
+    # smoke test in a sandboxed runner
+    errs.extend(_smoke_test_entity(low, ent.get("attributes", [])))
     return errs
 
 
-def _logic_checks(spec: Dict[str, Any]) -> List[Dict[str, Any]]:
+@timed(CHECK_SECONDS, check="logic")
+def _logic_checks(spec: Dict[str, Any], parsed: Optional[Dict[Path, Dict[str, Any]]] = None,
+                  workers: int = 1, only: Optional[set] = None) -> List[Dict[str, Any]]:
     errs = []
+    parsed = {} if parsed is None else parsed
     if "entities" not in spec or not isinstance(spec["entities"], list) or not spec["entities"]:
         errs.append({"type": "logic", "message": "Specification has no entities."})
         return errs
 
-    for ent in spec["entities"]:
-        name = ent.get("name", "")
-        if not name:
-            errs.append({"type": "logic", "message": "Entity without a name."})
-            continue
-        low = name.lower()
-        ent_dir = MODULES_DIR / low
-        init_py = ent_dir / "__init__.py"
-        list_tpl = ent_dir / "templates" / low / "list.html"
-        form_tpl = ent_dir / "templates" / low / "form.html"
-
-        if not init_py.exists():
-            errs.append({"type": "logic", "entity": name, "message": f"Missing {init_py}"})
-        if not list_tpl.exists():
-            errs.append({"type": "logic", "entity": name, "message": f"Missing {list_tpl}"})
-        if not form_tpl.exists():
-            errs.append({"type": "logic", "entity": name, "message": f"Missing {form_tpl}"})
-
-        # route names presence (basic heuristic)
-        if init_py.exists():
-            init_text = _read_text(init_py)
-            must_have = [f"def list_{low}", f"def new_{low}", f"def edit_{low}", f"def delete_{low}"]
-            for sig in must_have:
-                if sig not in init_text:
-                    errs.append({"type": "logic", "entity": name, "message": f"Route '{sig}()' not found in {init_py}"})
-
-        # attribute presence in templates (heuristic check)
-        attrs = ent.get("attributes", [])
-        if attrs:
-            list_text = _read_text(list_tpl) if list_tpl.exists() else ""
-            form_text = _read_text(form_tpl) if form_tpl.exists() else ""
-            for a in attrs:
-                aname = a.get("name", "")
-                if aname:
-                    if aname not in form_text:
-                        errs.append({"type": "logic", "entity": name, "message": f"Attribute '{aname}' not present in form.html"})
-                    if aname not in list_text:
-                        errs.append({"type": "logic", "entity": name, "message": f"Attribute '{aname}' not present in list.html"})
-
-        # smoke test in Flask
-        errs.extend(_smoke_test_entity(low))
+    known = set(known_entities(spec))  # refs may point at entities generated earlier
+    entities = [e for e in spec["entities"] if only is None or str(e.get("name", "")).lower() in only]
+
+    # entities are independent (smoke tests run in separate runner processes)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for ent_errs in pool.map(lambda ent: _entity_checks(ent, known, parsed), entities):
+            errs.extend(ent_errs)
 
     return errs
 
 
-def validate_module(spec: Dict[str, Any]) -> Dict[str, Any]:
+def validate_module(spec: Dict[str, Any], workers: int = 1, plan: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """
-    Orchestrates:
-      - syntax check for all generated *.py
-      - security scan
+    With a fix plan only the entities it lists are re-checked.
+    Orchestrates (entity checks on `workers` threads):
+      - one AST parse per generated *.py and one Jinja parse per template
+      - syntax and security checks on those parsed representations
       - logic checks against spec
       - smoke tests of blueprints
     Returns:
       {"status":"ok"}  OR  {"status":"issues","errors":[...]}
     """
     errors: List[Dict[str, Any]] = []
+    parsed: Dict[Path, Dict[str, Any]] = {}
+    only = None if plan is None else {n.lower() for n in plan.get("entities", [])}
 
-    # syntax + security on all generated modules
+    # syntax + security on all generated modules (or the planned ones)
     if MODULES_DIR.exists():
-        for ent_dir in MODULES_DIR.iterdir():
+        dirs = MODULES_DIR.iterdir() if only is None else [MODULES_DIR / n for n in sorted(only)]
+        for ent_dir in dirs:
             if not ent_dir.is_dir():
                 continue
             for py in ent_dir.rglob("*.py"):
-                errors.extend(_syntax_errors(py))
-                txt = _read_text(py)
-                errors.extend(_security_scan(txt, py))
-
-            # security scan templates
-            for tpl in ent_dir.rglob("*.html"):
-                txt = _read_text(tpl)
-                # Simple XSS heuristic: raw '{{ item[...]|safe }}' (we don't use |safe => fine)
-                # We still scan for '<script>' tags
-                if "<script>" in txt.lower():
-                    errors.append({
-                        "type": "security",
-                        "file": str(tpl),
-                        "message": "Inline <script> tag detected in template"
-                    })
+                info = _parsed(parsed, py, _analyze_module)
+                errors.extend(_syntax_errors(info))
+                errors.extend(_security_scan(info))
+
+            with span(CHECK_SECONDS, check="template_scan"):
+                for tpl in ent_dir.rglob("*.html"):
+                    errors.extend(_template_findings(_parsed(parsed, tpl, _analyze_template)))
 
     # logic/spec checks + smoke tests
-    errors.extend(_logic_checks(spec))
+    errors.extend(_logic_checks(spec, parsed, workers, only))
 
-    return {"status": "ok"} if not errors else {"status": "issues", "errors": errors}
\ No newline at end of file
+    return {"status": "ok"} if not errors else {"status": "issues", "errors": errors}
@@ -0,0 +1,20 @@
+"""
+Production entry point, e.g.:
+
+    gunicorn -w 4 -b 0.0.0.0:8000 wsgi:app
+    uvicorn --workers 4 wsgi:asgi_app        (needs asgiref)
+
+Every worker builds its own app through create_app() and reloads it when another
+worker publishes newly generated modules (shared registry generation in data/state.db).
+/metrics of any worker reports the totals of all of them (snapshots in data/state.db,
+written at most metrics.SHARE_INTERVAL seconds after a worker records something).
+"""
+from app import RegistryReloader, create_app
+
+app = application = RegistryReloader(create_app)
+
+try:
+    from asgiref.wsgi import WsgiToAsgi
+    asgi_app = WsgiToAsgi(app)
+except ImportError:  # only needed for ASGI servers
+    asgi_app = None